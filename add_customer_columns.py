@@ -5,6 +5,7 @@ Script để thêm các cột mới vào sheet KHACH_HANG
 
 import gspread
 from google.oauth2.service_account import Credentials
+from gspread.utils import rowcol_to_a1
 import os
 
 def add_customer_columns():
@@ -62,23 +63,26 @@ def add_customer_columns():
         
         # Add missing columns to the end
         current_col_count = len(headers)
-        start_col = current_col_count + 1
         
-        # Add headers for new columns
+        # Gom header + giá trị mặc định vào một lần gọi values.batchUpdate
+        data = []
         for i, col_name in enumerate(missing_columns):
-            col_letter = chr(ord('A') + current_col_count + i)
-            worksheet.update(f'{col_letter}1', col_name)
-            print(f"✅ Đã thêm cột {col_letter}: {col_name}")
+            cell = rowcol_to_a1(1, current_col_count + i + 1)
+            data.append({'range': f'KHACH_HANG!{cell}', 'values': [[col_name]]})
         
         # Fill default values (0) for existing customers
         num_rows = worksheet.row_count
         if num_rows > 1:  # Has data rows
-            for i, col_name in enumerate(missing_columns):
-                col_letter = chr(ord('A') + current_col_count + i)
-                # Fill with 0 for all existing customers
-                range_to_fill = f'{col_letter}2:{col_letter}{num_rows}'
-                worksheet.update(range_to_fill, [[0]] * (num_rows - 1))
-                print(f"✅ Đã điền giá trị mặc định cho cột {col_name}")
+            first_cell = rowcol_to_a1(2, current_col_count + 1)
+            last_cell = rowcol_to_a1(num_rows, current_col_count + len(missing_columns))
+            # Vùng mặc định là một hình chữ nhật toàn 0 nên gửi một range duy nhất
+            data.append({
+                'range': f'KHACH_HANG!{first_cell}:{last_cell}',
+                'values': [[0] * len(missing_columns)] * (num_rows - 1)
+            })
+        
+        sheet.values_batch_update({'valueInputOption': 'RAW', 'data': data})
+        print(f"✅ Đã thêm {len(missing_columns)} cột và điền giá trị mặc định")
         
         print("🎉 Hoàn thành! Đã thêm tất cả cột mới vào sheet KHACH_HANG")
         
@@ -1,72 +1,369 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
+from flask_cors import CORS
+import orjson
+import hashlib
 from google_sheets_api import GoogleSheetsAPI
 import os
-from datetime import datetime
+import threading
+import time
+from functools import wraps
+from cachetools import TTLCache
+from datetime import datetime, timedelta
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider dùng orjson cho jsonify/get_json thay cho json chuẩn"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json'
+        )
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+
+class CompressedBodies:
+    """Backend cache cho Flask-Compress: giữ bản đã nén của các body lấy từ cache
+    GET để cache hit không phải nén lại mỗi request.
+
+    Khóa gồm ETag của body (nội dung giống nhau thì ETag giống nhau) và
+    Accept-Encoding; response không có ETag (lỗi, POST...) không được lưu.
+    """
+    
+    def __init__(self):
+        self._store = TTLCache(maxsize=512, ttl=300)
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            return self._store.get(key)
+    
+    def set(self, key, value):
+        # Khóa rỗng ('' hoặc 'br;' ở bản Flask-Compress mới) = không có ETag
+        if key and not key.endswith(';'):
+            with self._lock:
+                self._store[key] = value
+
+def _compress_cache_key(req):
+    etag = g.get('body_etag')
+    return f"{etag}|{req.headers.get('Accept-Encoding', '')}" if etag else ''
 
-# Initialize Google Sheets API
+# Nén response (JSON danh sách khách hàng/hóa đơn nén rất tốt)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_CACHE_BACKEND'] = CompressedBodies
+app.config['COMPRESS_CACHE_KEY'] = _compress_cache_key
+Compress(app)
+
+# CORS: flask-cors dựng sẵn bộ header và tự trả lời preflight OPTIONS
+# (không chạy view nên không đụng tới sheets_api); max_age cho trình duyệt
+# nhớ kết quả preflight 24h thay vì hỏi lại trước mỗi PUT/DELETE
+CORS(app, origins='*',
+     methods=['GET', 'PUT', 'POST', 'DELETE', 'OPTIONS'],
+     allow_headers=['Content-Type', 'Authorization'],
+     send_wildcard=True,
+     max_age=86400)
+
+# Initialize Google Sheets API (một instance dùng chung cho mọi request)
 sheets_api = None
+_sheets_lock = threading.Lock()
 
 def init_sheets_api():
     global sheets_api
-    if not sheets_api:
+    if sheets_api is None:
+        with _sheets_lock:
+            if sheets_api is None:
+                try:
+                    sheets_api = GoogleSheetsAPI()
+                    print("✅ Google Sheets API initialized successfully!")
+                except Exception as e:
+                    print(f"❌ Error initializing Google Sheets API: {e}")
+                    sheets_api = None
+
+init_sheets_api()
+
+# Cache cho các GET chỉ đọc: gom nhiều lần đọc Google Sheets thành một lần mỗi TTL
+def _cache_ttl():
+    try:
+        ttl = int(os.environ.get('API_CACHE_TTL', 45))
+    except ValueError:
+        ttl = 45
+    return min(max(ttl, 5), 300)
+
+_cache = TTLCache(maxsize=256, ttl=_cache_ttl())
+_cache_lock = threading.RLock()
+_pending = {}  # key -> threading.Event của request đang lấy dữ liệu cho key đó
+# prefix -> số lần invalidate_cache(prefix); kết quả lấy xong sau một lần ghi
+# (bắt đầu trước khi ghi) thì không lưu vào cache
+_generations = {}
+
+def _generation(path):
+    return sum(count for prefix, count in _generations.items() if path.startswith(prefix))
+
+def _json_response(body):
+    return app.response_class(body, mimetype='application/json')
+
+def _cached_response(entry):
+    """Response cho entry (etag, body) của cache; 304 nếu client đã có bản này.
+
+    ETag là weak (W/"..."), If-None-Match vốn so sánh kiểu weak. Flask-Compress
+    gắn thêm đuôi thuật toán ("...:br") vào ETag của response đã nén nên chỉ
+    so phần hash ở đầu.
+    """
+    etag, body = entry
+    if etag is None:
+        return _json_response(body)
+    if f'"{etag}' in request.headers.get('If-None-Match', ''):
+        response = app.response_class(status=304)
+    else:
+        response = _json_response(body)
+        g.body_etag = etag
+    response.set_etag(etag, weak=True)
+    return response
+
+def _fetch_into_cache(key, fetch):
+    """Gọi fetch(), serialize kết quả và lưu (etag, body) vào cache nếu thành công.
+
+    fetch() trả dict kết quả, hoặc bytes JSON đã serialize sẵn (chỉ khi thành công).
+    Kết quả lỗi không lưu và không có etag. Có invalidate_cache() cho key này
+    trong lúc fetch() chạy thì kết quả chỉ trả về, không lưu (có thể là số liệu trước lần ghi).
+    """
+    with _cache_lock:
+        generation = _generation(key[0])
+    result = fetch()
+    if isinstance(result, bytes):
+        body = result
+    else:
+        body = orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+    if not isinstance(result, bytes) and not result.get('success'):
+        return None, body
+    
+    entry = (hashlib.blake2b(body, digest_size=16).hexdigest(), body)
+    with _cache_lock:
+        if _generation(key[0]) == generation:
+            _cache[key] = entry
+    return entry
+
+def cached_get(fetch):
+    """Trả response JSON cho GET từ cache theo (path, query args).
+
+    Cache lưu sẵn bytes đã serialize nên cache hit không tốn công encode JSON;
+    chỉ lưu kết quả thành công. Kèm ETag để client gửi lại If-None-Match
+    nhận 304 không body.
+
+    Khi cache hết hạn, chỉ một request gọi fetch() cho mỗi key, các request
+    cùng key khác chờ kết quả đó thay vì cùng gọi Google Sheets.
+    """
+    key = (request.path, tuple(sorted(request.args.items())))
+    with _cache_lock:
+        if key[0].startswith('/api/stats'):
+            _refreshers[key] = fetch
+        entry = _cache.get(key)
+        if entry is not None:
+            return _cached_response(entry)
+        event = _pending.get(key)
+        leader = event is None
+        if leader:
+            event = _pending[key] = threading.Event()
+    
+    if not leader:
+        event.wait(timeout=10)
+        with _cache_lock:
+            entry = _cache.get(key)
+        # Request dẫn đầu lỗi hoặc quá lâu: tự lấy dữ liệu
+        if entry is None:
+            entry = _fetch_into_cache(key, fetch)
+        return _cached_response(entry)
+    
+    try:
+        return _cached_response(_fetch_into_cache(key, fetch))
+    finally:
+        with _cache_lock:
+            _pending.pop(key, None)
+        event.set()
+
+# Làm mới nền các thống kê vừa được xem để request kế tiếp luôn trúng cache.
+# Mỗi process (gunicorn worker) có cache riêng nên mỗi process tự làm mới.
+_REFRESH_IDLE_SECONDS = 600
+# key -> fetch; key không ai xem trong 10 phút tự hết hạn, tối đa 64 key
+_refreshers = TTLCache(maxsize=64, ttl=_REFRESH_IDLE_SECONDS)
+
+def _refresh_loop(interval):
+    while True:
+        time.sleep(interval)
+        if sheets_api is None:
+            continue
+        with _cache_lock:
+            refreshers = list(_refreshers.items())
+        for key, fetch in refreshers:
+            try:
+                _fetch_into_cache(key, fetch)
+            except Exception as e:
+                print(f"⚠️ Background refresh failed for {key}: {e}")
+
+def start_background_refresh():
+    """Bật làm mới nền nếu đặt STATS_REFRESH_SECONDS > 0 (tắt mặc định, vd. Vercel)"""
+    try:
+        interval = int(os.environ.get('STATS_REFRESH_SECONDS', 0))
+    except ValueError:
+        interval = 0
+    if interval > 0:
+        threading.Thread(target=_refresh_loop, args=(interval,), daemon=True).start()
+
+start_background_refresh()
+
+# Prefetch khoảng ngày liền trước/liền sau của thống kê: người dùng hay bấm
+# lùi/tiến theo ngày/tuần nên lần xem kế tiếp trúng cache ngay
+_prefetch_slots = threading.BoundedSemaphore(4)
+
+def _adjacent_windows(date_from, date_to):
+    """Trả [(from, to)] của khoảng liền trước và liền sau, cùng độ dài"""
+    start = datetime.strptime(date_from, '%Y-%m-%d')
+    end = datetime.strptime(date_to, '%Y-%m-%d')
+    span = end - start + timedelta(days=1)
+    return [((start + step).strftime('%Y-%m-%d'), (end + step).strftime('%Y-%m-%d'))
+            for step in (-span, span)]
+
+def _prefetch(key, fetch):
+    try:
+        _fetch_into_cache(key, fetch)
+    except Exception as e:
+        print(f"⚠️ Prefetch failed for {key}: {e}")
+    finally:
+        _prefetch_slots.release()
+
+def prefetch_adjacent_windows(fetch_window):
+    """Nạp nền vào cache các khoảng ngày liền kề của request hiện tại"""
+    args = request.args.to_dict()
+    try:
+        windows = _adjacent_windows(args['from'], args['to'])
+    except (KeyError, ValueError):
+        return
+    for date_from, date_to in windows:
+        args['from'], args['to'] = date_from, date_to
+        key = (request.path, tuple(sorted(args.items())))
+        with _cache_lock:
+            if key in _cache or key in _pending:
+                continue
+        # Đủ 4 luồng prefetch đang chạy thì bỏ qua, không bắt request chờ
+        if not _prefetch_slots.acquire(blocking=False):
+            return
+        threading.Thread(target=_prefetch, daemon=True,
+                         args=(key, lambda f=date_from, t=date_to: fetch_window(f, t))).start()
+
+def cached_window(fetch_window):
+    """cached_get cho thống kê theo from/to, kèm prefetch khoảng liền kề"""
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    response = cached_get(lambda: fetch_window(date_from, date_to))
+    prefetch_adjacent_windows(fetch_window)
+    return response
+
+def invalidate_cache(*prefixes):
+    """Xóa các entry cache có path bắt đầu bằng một trong các prefix"""
+    with _cache_lock:
+        for prefix in prefixes:
+            _generations[prefix] = _generations.get(prefix, 0) + 1
+        for key in list(_cache.keys()):
+            if key[0].startswith(prefixes):
+                _cache.pop(key, None)
+
+# Route decorators
+_NOT_CONNECTED = {'success': False, 'message': 'Google Sheets not connected'}
+
+def requires_sheets(f):
+    """Trả lỗi 'not connected' nếu chưa khởi tạo được Google Sheets API"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if sheets_api is None:
+            # Thử khởi tạo lại (lần đầu lỗi mạng...), chỉ chạy trên nhánh lỗi
+            init_sheets_api()
+            if sheets_api is None:
+                return jsonify(_NOT_CONNECTED)
+        return f(*args, **kwargs)
+    return wrapper
+
+def json_errors(f):
+    """Chuyển mọi exception của handler thành response JSON {'success': False}"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
         try:
-            sheets_api = GoogleSheetsAPI()
-            print("✅ Google Sheets API initialized successfully!")
+            return f(*args, **kwargs)
         except Exception as e:
-            print(f"❌ Error initializing Google Sheets API: {e}")
-            sheets_api = None
-
-# CORS middleware
-@app.after_request
-def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
+            return jsonify({'success': False, 'message': str(e)})
+    return wrapper
+
+# Kiểm tra body của request ghi trước khi gọi Google Sheets: thiếu trường thì
+# trả lỗi ngay thay vì KeyError giữa lúc đang ghi sheet
+_CUSTOMER_FIELDS = frozenset(['code', 'name', 'phone', 'last4'])
+_PRODUCT_FIELDS = frozenset(['code', 'name', 'category', 'price'])
+_PRODUCT_UPDATE_FIELDS = frozenset(['name', 'category', 'price'])
+_INVOICE_FIELDS = frozenset([
+    'invoiceId', 'customerCode', 'customerName', 'customerPhone',
+    'products', 'subtotal', 'total', 'paymentMethod'
+])
+
+def json_body():
+    """Parse body bằng orjson (không giữ lại bản copy); None nếu không phải JSON object"""
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def body_item(kind, required, data=None):
+    """Trả body[kind] nếu là object có đủ các trường required, ngược lại None.
+    data: body đã parse sẵn (mặc định đọc từ request)"""
+    if data is None:
+        data = json_body()
+    item = data.get(kind) if data is not None else None
+    if not isinstance(item, dict) or not required <= item.keys():
+        return None
+    return item
+
+# Body của health/debug không đổi nên serialize sẵn một lần khi import
+_HEALTH_OK = orjson.dumps({
+    'status': 'ok',
+    'message': 'Sky Cafe API Server Running',
+    'sheets_connected': True
+})
+_HEALTH_DOWN = orjson.dumps({
+    'status': 'ok',
+    'message': 'Sky Cafe API Server Running',
+    'sheets_connected': False
+})
+_DEBUG_BODY = orjson.dumps({
+    'success': True, 
+    'message': 'Debug API - Fixed date filtering v2.0',
+    'timestamp': '2025-10-16T10:00:00Z',
+    'code_version': '979a9d5',
+    'file': 'api_server.py'
+})
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({
-        'status': 'ok',
-        'message': 'Sky Cafe API Server Running',
-        'sheets_connected': sheets_api is not None
-    })
+    return _json_response(_HEALTH_OK if sheets_api is not None else _HEALTH_DOWN)
 
 @app.route('/api/debug', methods=['GET'])
 def debug_api():
-    return jsonify({
-        'success': True, 
-        'message': 'Debug API - Fixed date filtering v2.0',
-        'timestamp': '2025-10-16T10:00:00Z',
-        'code_version': '979a9d5',
-        'file': 'api_server.py'
-    })
-
-@app.route('/api/customers', methods=['POST'])
-def create_customer():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
-    try:
-        data = request.get_json()
-        result = sheets_api.create_customer(data)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    return _json_response(_DEBUG_BODY)
 
 @app.route('/api/test-update', methods=['POST'])
+@requires_sheets
 def test_update():
     try:
         data = request.get_json()
         print(f"🧪 Test update with data: {data}")
         
-        init_sheets_api()
-        if not sheets_api:
-            return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-        
         # Test simple operation
         worksheet = sheets_api.sheet.worksheet('KHACH_HANG')
         all_values = worksheet.get_all_values()
@@ -75,18 +372,18 @@ def test_update():
         return jsonify({'success': True, 'message': 'Test successful', 'rows': len(all_values)})
     except Exception as e:
         print(f"❌ Test error: {str(e)}")
-        import traceback
-        print(f"❌ Traceback: {traceback.format_exc()}")
+        # Stack trace chỉ khi chạy debug (tốn công dựng chuỗi, production không cần)
+        if app.debug:
+            app.logger.exception('test_update failed')
         return jsonify({'success': False, 'message': str(e)})
 
 @app.route('/api/customers/<customer_code>', methods=['PUT'])
+@requires_sheets
 def update_customer(customer_code):
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
     try:
-        data = request.get_json()
+        data = json_body()
+        if data is None:
+            return jsonify({'success': False, 'message': 'Invalid customer data'})
         print(f"🔍 Update customer {customer_code} with data: {data}")
         
         # Test if sheets_api exists and has update_customer method
@@ -94,238 +391,179 @@ def update_customer(customer_code):
             return jsonify({'success': False, 'message': 'update_customer method not found'})
         
         result = sheets_api.update_customer(customer_code, data)
+        invalidate_cache('/api/customers', '/api/stats')
         print(f"✅ Update result: {result}")
         return jsonify(result)
     except Exception as e:
-        print(f"❌ Update error: {str(e)}")
-        print(f"❌ Error type: {type(e)}")
-        import traceback
-        print(f"❌ Traceback: {traceback.format_exc()}")
+        print(f"❌ Update error ({type(e).__name__}): {str(e)}")
+        if app.debug:
+            app.logger.exception('update_customer failed')
         return jsonify({'success': False, 'message': str(e)})
 
 @app.route('/api/customers/<customer_code>', methods=['DELETE'])
+@requires_sheets
+@json_errors
 def delete_customer(customer_code):
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
-    try:
-        result = sheets_api.delete_customer(customer_code)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    result = sheets_api.delete_customer(customer_code)
+    invalidate_cache('/api/customers', '/api/stats')
+    return jsonify(result)
 
 @app.route('/api/customers/update-sheet-structure', methods=['POST'])
+@requires_sheets
+@json_errors
 def update_sheet_structure():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
+    result = sheets_api.update_sheet_structure()
+    invalidate_cache('/api/customers')
+    return jsonify(result)
+
+def _rows_body(rows):
+    """Serialize danh sách thẳng từ iterator của sheet từng dòng một, không dựng
+    list dict trung gian rồi mới encode cả khối"""
     try:
-        result = sheets_api.update_sheet_structure()
-        return jsonify(result)
+        first = next(rows, None)
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+        return {'success': False, 'message': str(e)}
+    
+    body = bytearray(b'{"success":true,"data":[')
+    if first is not None:
+        body += orjson.dumps(first)
+        for row in rows:
+            body += b','
+            body += orjson.dumps(row)
+    body += b']}'
+    return bytes(body)
 
 @app.route('/api/test', methods=['GET'])
+@requires_sheets
+@json_errors
 def test_connection():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
+    # Chỉ cần đếm số dòng; hai sheet được tải song song
+    sheets_api.prefetch_sheets('KHACH_HANG', 'SAN_PHAM')
+    customers = sheets_api.get_customers(columns=('Mã KH',))
+    products = sheets_api.get_products(columns=('Mã SP',))
     
-    try:
-        customers = sheets_api.get_customers()
-        products = sheets_api.get_products()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Google Sheets connection successful',
-            'customers_count': len(customers.get('data', [])) if customers.get('success') else 0,
-            'products_count': len(products.get('data', [])) if products.get('success') else 0
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({
+        'success': True,
+        'message': 'Google Sheets connection successful',
+        'customers_count': len(customers.get('data', [])) if customers.get('success') else 0,
+        'products_count': len(products.get('data', [])) if products.get('success') else 0
+    })
 
 @app.route('/api/customers', methods=['GET', 'POST'])
+@requires_sheets
+@json_errors
 def handle_customers():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
     if request.method == 'GET':
-        try:
-            result = sheets_api.get_customers()
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+        return cached_get(lambda: _rows_body(sheets_api.iter_customers()))
     
-    elif request.method == 'POST':
-        try:
-            data = request.get_json()
-            if not data or 'customer' not in data:
-                return jsonify({'success': False, 'message': 'Invalid customer data'})
-            
-            result = sheets_api.add_customer(data['customer'])
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+    data = json_body()
+    if data is None:
+        return jsonify({'success': False, 'message': 'Invalid customer data'})
+    
+    if 'customer' in data:
+        # Dạng {'customer': {code, name, phone, last4}} (khách tạo lúc lập hóa đơn)
+        customer = body_item('customer', _CUSTOMER_FIELDS, data)
+        if customer is None:
+            return jsonify({'success': False, 'message': 'Invalid customer data'})
+        result = sheets_api.add_customer(customer)
+    else:
+        # Form khách hàng gửi thẳng các cột của sheet ('Tên Khách Hàng', ...)
+        result = sheets_api.create_customer(data)
+    invalidate_cache('/api/customers', '/api/stats')
+    return jsonify(result)
 
 @app.route('/api/products', methods=['GET', 'POST'])
+@requires_sheets
+@json_errors
 def handle_products():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
     if request.method == 'GET':
-        try:
-            result = sheets_api.get_products()
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+        return cached_get(sheets_api.get_products)
     
-    elif request.method == 'POST':
-        try:
-            data = request.get_json()
-            if not data or 'product' not in data:
-                return jsonify({'success': False, 'message': 'Invalid product data'})
-            
-            result = sheets_api.add_product(data['product'])
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+    product = body_item('product', _PRODUCT_FIELDS)
+    if product is None:
+        return jsonify({'success': False, 'message': 'Invalid product data'})
+    
+    result = sheets_api.add_product(product)
+    invalidate_cache('/api/products', '/api/stats')
+    return jsonify(result)
 
 @app.route('/api/products/<product_id>', methods=['PUT', 'DELETE'])
+@requires_sheets
+@json_errors
 def handle_product_by_id(product_id):
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
     if request.method == 'PUT':
-        try:
-            data = request.get_json()
-            if not data or 'product' not in data:
-                return jsonify({'success': False, 'message': 'Invalid product data'})
-            
-            result = sheets_api.update_product(product_id, data['product'])
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+        product = body_item('product', _PRODUCT_UPDATE_FIELDS)
+        if product is None:
+            return jsonify({'success': False, 'message': 'Invalid product data'})
+        
+        result = sheets_api.update_product(product_id, product)
+    else:
+        result = sheets_api.delete_product(product_id)
     
-    elif request.method == 'DELETE':
-        try:
-            result = sheets_api.delete_product(product_id)
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+    invalidate_cache('/api/products', '/api/stats')
+    return jsonify(result)
 
 @app.route('/api/invoices', methods=['GET', 'POST'])
+@requires_sheets
+@json_errors
 def handle_invoices():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
     if request.method == 'GET':
-        try:
-            result = sheets_api.get_invoices()
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
+        return cached_get(lambda: _rows_body(sheets_api.iter_invoices()))
     
-    elif request.method == 'POST':
-        try:
-            data = request.get_json()
-            if not data or 'invoice' not in data:
-                return jsonify({'success': False, 'message': 'Invalid invoice data'})
-            
-            result = sheets_api.save_invoice(data['invoice'])
-            return jsonify(result)
-        except Exception as e:
-            return jsonify({'success': False, 'message': str(e)})
-
-@app.route('/api/stats/dashboard', methods=['GET'])
-def get_dashboard_stats():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
+    invoice = body_item('invoice', _INVOICE_FIELDS)
+    if invoice is None:
+        return jsonify({'success': False, 'message': 'Invalid invoice data'})
     
-    try:
-        date_from = request.args.get('from')
-        date_to = request.args.get('to')
-        debug_mode = request.args.get('debug', 'false').lower() == 'true'
-        
-        result = sheets_api.get_dashboard_stats(date_from, date_to, debug_mode)
-        
-        # Add debug info if requested
-        if debug_mode:
-            debug_info = {
-                'date_from': date_from,
-                'date_to': date_to,
-                'debug_mode': True,
-                'timestamp': datetime.now().isoformat()
-            }
-            result['debug_info'] = debug_info
-        
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    result = sheets_api.save_invoice(invoice)
+    invalidate_cache('/api/invoices', '/api/customers', '/api/stats')
+    return jsonify(result)
 
-@app.route('/api/stats/products', methods=['GET'])
-def get_product_stats():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
-    try:
-        date_from = request.args.get('from')
-        date_to = request.args.get('to')
-        result = sheets_api.get_product_stats(date_from, date_to)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+# Các loại thống kê dùng chung một route; mỗi hàm nhận (args, date_from, date_to)
+# với args là query đã copy ra dict để prefetch chạy ngoài request vẫn dùng được
+_STATS = {
+    'dashboard': lambda args, date_from, date_to: sheets_api.get_dashboard_stats(date_from, date_to),
+    'products': lambda args, date_from, date_to: sheets_api.get_product_stats(date_from, date_to),
+    'customers': lambda args, date_from, date_to: sheets_api.get_customer_stats(date_from, date_to),
+    'revenue': lambda args, date_from, date_to: sheets_api.get_revenue_stats(
+        args.get('period', 'day'), date_from, date_to),
+}
 
-@app.route('/api/stats/customers', methods=['GET'])
-def get_customer_stats():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
-    try:
-        date_from = request.args.get('from')
-        date_to = request.args.get('to')
-        result = sheets_api.get_customer_stats(date_from, date_to)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+def _dashboard_debug(date_from, date_to):
+    """Dashboard ở chế độ debug: luôn lấy dữ liệu mới, không đi qua cache"""
+    result = sheets_api.get_dashboard_stats(date_from, date_to, True)
+    result['debug_info'] = {
+        'date_from': date_from,
+        'date_to': date_to,
+        'debug_mode': True,
+        'timestamp': datetime.now().isoformat()
+    }
+    return jsonify(result)
 
-@app.route('/api/stats/revenue', methods=['GET'])
-def get_revenue_stats():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
+@app.route('/api/stats/<kind>', methods=['GET'])
+@requires_sheets
+@json_errors
+def get_stats(kind):
+    stats = _STATS.get(kind)
+    if stats is None:
+        return jsonify({'success': False, 'message': f'Unknown stats type: {kind}'}), 404
     
-    try:
-        period = request.args.get('period', 'day')
-        date_from = request.args.get('from')
-        date_to = request.args.get('to')
-        result = sheets_api.get_revenue_stats(period, date_from, date_to)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    args = request.args.to_dict()
+    if kind == 'dashboard' and args.get('debug', 'false').lower() == 'true':
+        return _dashboard_debug(args.get('from'), args.get('to'))
+    
+    return cached_window(lambda date_from, date_to: stats(args, date_from, date_to))
 
 @app.route('/api/export/excel', methods=['GET'])
+@requires_sheets
+@json_errors
 def export_to_excel():
-    init_sheets_api()
-    if not sheets_api:
-        return jsonify({'success': False, 'message': 'Google Sheets not connected'})
-    
-    try:
-        date_from = request.args.get('from')
-        date_to = request.args.get('to')
-        result = sheets_api.export_to_excel(date_from, date_to)
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    result = sheets_api.export_to_excel(date_from, date_to)
+    return jsonify(result)
 
+# Chạy trực tiếp chỉ dành cho dev; production chạy qua gunicorn + gevent
+# (xem render.yaml) để các request chờ Google Sheets không chặn lẫn nhau
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -6,100 +6,353 @@ Sky Cafe & Board Game - Invoice Management System
 
 import gspread
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from gspread.utils import fill_gaps, numericise, numericise_all, rowcol_to_a1
+import heapq
 import json
+import logging
+import math
+import orjson
 import os
-import xlsxwriter
-from datetime import datetime
-import pytz
+import threading
+import time
+from collections import defaultdict
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from operator import itemgetter
+
+# Log chi tiết của các hàm ghi (DEBUG); mặc định chỉ WARNING trở lên được in ra
+logger = logging.getLogger(__name__)
+
+# Giờ Việt Nam: UTC+7 cố định, không có DST nên không cần tra múi giờ qua pytz
+VN_TZ = timezone(timedelta(hours=7))
+
+# Ký tự bỏ đi khi đọc số tiền ("150,000 đ" / "150.000 ₫" -> "150000")
+_AMOUNT_STRIP = str.maketrans('', '', 'đ₫,. ')
+# Ký tự bỏ đi khi so số điện thoại ("'090 123-4567" -> "0901234567")
+_PHONE_STRIP = str.maketrans('', '', " -()'")
+# Ký hiệu tiền tệ và dấu phân cách hàng nghìn của ô Tổng Chi Tiêu ("1,250,000.50 đ" -> "1250000.50")
+_SPENT_STRIP = str.maketrans('', '', 'đ₫, ')
+# Các cột hóa đơn get_dashboard_stats thật sự đọc (lọc ngày, doanh thu, hình thức TT, khách)
+_DASHBOARD_INVOICE_COLUMNS = frozenset(('Ngày Giờ', 'Tổng Thanh Toán', 'Hình Thức TT', 'Tên Khách'))
+# Ngày 'dd' -> tuần trong tháng cho get_revenue_stats (1-7: tuần 1, 8-14: tuần 2, ...)
+_WEEK_OF_DAY = {f"{day:02d}": (day - 1) // 7 + 1 for day in range(32)}
+# get_product_stats chỉ cần ngày (để lọc) và chi tiết sản phẩm
+_PRODUCT_STATS_INVOICE_COLUMNS = frozenset(('Ngày Giờ', 'Chi Tiết SP (JSON)'))
+# get_customer_stats: ngày, mã khách và số tiền
+_CUSTOMER_STATS_INVOICE_COLUMNS = frozenset(('Ngày Giờ', 'Mã KH', 'Tổng Thanh Toán'))
+
+
+def _normalize_phone(phone):
+    return str(phone).translate(_PHONE_STRIP)
+
+
+def _request_amount(amount):
+    """Số tiền hóa đơn từ request (frontend gửi String(parseFloat(...)), vd. "11110.5")
+    hoặc ô Tổng Chi Tiêu đã bỏ ký hiệu tiền tệ -> số nguyên đồng.
+    Không đọc được, âm hoặc không hữu hạn thì tính là 0"""
+    try:
+        value = float(amount)
+    except (TypeError, ValueError):
+        return 0
+    if not math.isfinite(value) or value < 0:
+        return 0
+    return round(value)
+
+
+@lru_cache(maxsize=8192)
+def _parse_amount_text(amount_str):
+    """Số tiền từ ô dạng chuỗi ("150,000 đ" -> 150000.0), 0.0 nếu không đọc được.
+    Cùng một mức giá lặp lại rất nhiều trên sheet nên nhớ kết quả theo chuỗi gốc"""
+    amount_str = amount_str.strip().translate(_AMOUNT_STRIP)
+    if not amount_str:
+        return 0.0
+    try:
+        return float(amount_str)
+    except ValueError:
+        return 0.0
+
+
+@lru_cache(maxsize=65536)
+def _invoice_date_key(invoice_date_str):
+    """DD/MM/YYYY HH:MM -> YYYY-MM-DD (None nếu không đọc được).
+    
+    Hàm thuần nên cache theo chuỗi gốc: các lần xem dashboard/thống kê liên tiếp
+    parse lại đúng những ô 'Ngày Giờ' cũ, chỉ hóa đơn mới phải parse thật.
+    """
+    try:
+        if not invoice_date_str:
+            return None
+        
+        # Convert to string and strip whitespace
+        invoice_date_str = str(invoice_date_str).strip()
+        
+        # Đường nhanh cho định dạng save_invoice ghi ra ('DD/MM/YYYY HH:MM'):
+        # cắt chuỗi theo vị trí, không split/zfill/int
+        if (len(invoice_date_str) >= 10 and invoice_date_str[2] == '/' and invoice_date_str[5] == '/'
+                and (len(invoice_date_str) == 10 or invoice_date_str[10] == ' ')):
+            day, month, year = invoice_date_str[0:2], invoice_date_str[3:5], invoice_date_str[6:10]
+            if day.isdigit() and month.isdigit() and year.isdigit() and month <= '12' and day <= '31':
+                return f"{year}-{month}-{day}"
+            return None
+        
+        # Handle different date formats
+        if ' ' in invoice_date_str:
+            date_part = invoice_date_str.split(' ')[0]  # Get DD/MM/YYYY part
+        else:
+            date_part = invoice_date_str
+        
+        # Split by '/' and ensure we have 3 parts
+        date_parts = date_part.split('/')
+        if len(date_parts) != 3:
+            return None
+        
+        day, month, year = date_parts
+        
+        # Validate and format
+        day = day.zfill(2)
+        month = month.zfill(2)
+        year = year.zfill(4)
+        
+        # Basic validation
+        if len(year) != 4 or int(month) > 12 or int(day) > 31:
+            return None
+        
+        return f"{year}-{month}-{day}"
+    except Exception as e:
+        print(f"Error parsing date '{invoice_date_str}': {e}")
+        return None
+
 
 class GoogleSheetsAPI:
+    # Số giây giữ bản sao dữ liệu sheet trong bộ nhớ cho các hàm đọc/thống kê
+    SNAPSHOT_TTL = 20
+    # Số giây giữ danh sách SĐT khách hàng cho add_customer kiểm tra trùng
+    PHONE_INDEX_TTL = 60
+    
     def __init__(self, credentials_file='google-credentials.json'):
         """Initialize Google Sheets API connection"""
         self.credentials_file = credentials_file
         self.gc = None
         self.sheet = None
+        self._worksheets = {}  # tên sheet -> gspread Worksheet
+        self._snapshots = {}  # tên sheet -> (thời điểm đọc, get_all_values())
+        self._loading = {}  # tên sheet -> threading.Event của lượt tải đang chạy
+        self._generations = {}  # tên sheet -> số lần bị ghi (bỏ kết quả tải cũ)
+        self._snapshot_lock = threading.Lock()
+        self._phones = None  # (thời điểm đọc, generation KHACH_HANG, {SĐT đã chuẩn hóa: tên khách})
+        self._date_index = None  # (bản sao HOA_DON, ngày đã sắp xếp, vị trí dòng) - xem _invoice_date_index
         self.connect()
     
-    def _parse_invoice_date(self, invoice_date_str):
-        """Convert DD/MM/YYYY HH:MM to YYYY-MM-DD for comparison"""
+    def _sheet_values(self, title):
+        """get_all_values() của sheet, dùng lại bản sao trong bộ nhớ nếu còn mới.
+        
+        Các hàm thống kê cùng đọc HOA_DON/KHACH_HANG/SAN_PHAM nên một lần tải
+        phục vụ được nhiều lần tính trong SNAPSHOT_TTL giây. Chỉ dùng cho đọc;
+        các hàm sửa/xóa vẫn đọc trực tiếp để tìm đúng dòng.
+        
+        Nhiều request cùng lúc (dashboard gọi 4 thống kê song song) chỉ tải mỗi
+        sheet một lần; các request còn lại chờ lượt tải đó.
+        """
+        values = self._fresh_snapshot(title)
+        if values is not None:
+            return values
+        
+        with self._snapshot_lock:
+            event = self._loading.get(title)
+            leader = event is None
+            if leader:
+                event = self._loading[title] = threading.Event()
+        
+        if not leader:
+            event.wait(timeout=10)
+            values = self._fresh_snapshot(title)
+            if values is not None:
+                return values
+            # Lượt tải kia lỗi hoặc quá lâu: tự tải
+        
         try:
-            if not invoice_date_str:
-                return None
-            
-            # Convert to string and strip whitespace
-            invoice_date_str = str(invoice_date_str).strip()
-            
-            # Handle different date formats
-            if ' ' in invoice_date_str:
-                date_part = invoice_date_str.split(' ')[0]  # Get DD/MM/YYYY part
-            else:
-                date_part = invoice_date_str
-            
-            # Split by '/' and ensure we have 3 parts
-            date_parts = date_part.split('/')
-            if len(date_parts) != 3:
-                return None
-            
-            day, month, year = date_parts
-            
-            # Validate and format
-            day = day.zfill(2)
-            month = month.zfill(2)
-            year = year.zfill(4)
-            
-            # Basic validation
-            if len(year) != 4 or int(month) > 12 or int(day) > 31:
-                return None
-            
-            return f"{year}-{month}-{day}"
-        except Exception as e:
-            print(f"Error parsing date '{invoice_date_str}': {e}")
-            return None
+            return self._load_values(title)
+        finally:
+            if leader:
+                with self._snapshot_lock:
+                    self._loading.pop(title, None)
+                event.set()
     
-    def _safe_parse_amount(self, amount_str):
-        """Safely parse amount string to float"""
-        try:
-            if not amount_str:
-                return 0.0
-            
-            # Convert to string and clean
-            amount_str = str(amount_str).strip()
-            
-            # Remove common currency symbols and formatting
-            amount_str = amount_str.replace('đ', '').replace(',', '').replace('.', '')
-            
-            # Handle empty string
-            if not amount_str:
-                return 0.0
-                
-            return float(amount_str)
-        except:
-            return 0.0
+    def _load_values(self, title):
+        loaded_at = time.monotonic()
+        generation = self._generations.get(title, 0)
+        values = self._worksheet(title).get_all_values()
+        self._store_snapshot(title, loaded_at, generation, values)
+        return values
+    
+    def _store_snapshot(self, title, loaded_at, generation, values):
+        """Lưu bản sao, trừ khi sheet bị ghi trong lúc đang tải (dữ liệu đã cũ)"""
+        with self._snapshot_lock:
+            if self._generations.get(title, 0) == generation:
+                self._snapshots[title] = (loaded_at, values)
     
-    def _filter_invoices_by_date(self, invoice_data, date_from, date_to):
-        """Filter invoices by date range"""
-        if not date_from or not date_to or date_from == '' or date_to == '':
-            return invoice_data
+    def _worksheet(self, title):
+        """Worksheet theo tên, giữ lại sau lần đầu (spreadsheet.worksheet() của
+        gspread tải lại metadata cả file mỗi lần gọi)"""
+        worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            worksheet = self._worksheets[title] = self.sheet.worksheet(title)
+        return worksheet
+    
+    def _fresh_snapshot(self, title):
+        """Bản sao còn trong TTL của sheet, hoặc None"""
+        with self._snapshot_lock:
+            snapshot = self._snapshots.get(title)
+        if snapshot and time.monotonic() - snapshot[0] < self.SNAPSHOT_TTL:
+            return snapshot[1]
+        return None
+    
+    def prefetch_sheets(self, *titles):
+        """Tải các sheet chưa có bản sao mới trong một request values.batchGet,
+        để hàm cần nhiều sheet chỉ tốn một lượt gọi (và một lần quota) thay vì
+        mỗi sheet một lượt"""
+        stale = [title for title in titles if self._fresh_snapshot(title) is None]
+        if len(stale) < 2:
+            return
         
-        filtered_invoices = []
-        date_parse_errors = []
+        loaded_at = time.monotonic()
+        generations = [self._generations.get(title, 0) for title in stale]
+        response = self.sheet.values_batch_get(stale)
+        for title, generation, value_range in zip(stale, generations, response.get('valueRanges', [])):
+            # Đệm ô trống cho đủ hàng như get_all_values()
+            self._store_snapshot(title, loaded_at, generation,
+                                 fill_gaps(value_range.get('values', [])))
+    
+    def _iter_records(self, title, columns=None):
+        """Như worksheet.get_all_records() (header dòng 1, số được parse) nhưng
+        đọc từ bản sao, chỉ tốn một request thay vì hai và trả từng dòng một.
+        columns: chỉ giữ các cột có tên trong tập này (None = tất cả)"""
+        yield from self._records(self._sheet_values(title), columns)
+    
+    @staticmethod
+    def _records(values, columns=None, positions=None):
+        """Records từ get_all_values(); positions: chỉ các dòng này (index trong values)"""
+        if len(values) <= 1:
+            return
+        headers = values[0]
+        rows = values[1:] if positions is None else map(values.__getitem__, positions)
+        if columns is None:
+            for row in rows:
+                yield dict(zip(headers, numericise_all(row)))
+        else:
+            picked = [(i, header) for i, header in enumerate(headers) if header in columns]
+            for row in rows:
+                yield {header: numericise(row[i]) for i, header in picked}
+    
+    def _sheet_records(self, title, columns=None):
+        return list(self._iter_records(title, columns))
+    
+    def _invoice_date_index(self, values):
+        """(ngày YYYY-MM-DD đã sắp xếp, vị trí dòng tương ứng) của một bản sao HOA_DON.
+        Dựng một lần cho mỗi bản sao; lọc theo khoảng ngày chỉ còn là hai lần bisect"""
+        cached = self._date_index
+        if cached is not None and cached[0] is values:
+            return cached[1], cached[2]
         
-        for invoice in invoice_data:
-            invoice_date = invoice.get('Ngày Giờ', '')
-            formatted_date = self._parse_invoice_date(invoice_date)
-            
+        headers = values[0] if values else []
+        col = headers.index('Ngày Giờ') if 'Ngày Giờ' in headers else None
+        dated = []
+        date_parse_errors = []
+        for position in range(1, len(values)):
+            row = values[position]
+            invoice_date = row[col] if col is not None and col < len(row) else ''
+            formatted_date = _invoice_date_key(invoice_date)
             if formatted_date is None:
-                date_parse_errors.append(f"Failed to parse: '{invoice_date}'")
+                if len(date_parse_errors) < 5:  # chỉ in 5 lỗi đầu
+                    date_parse_errors.append(f"Failed to parse: '{invoice_date}'")
                 continue
-            
-            if date_from <= formatted_date <= date_to:
-                filtered_invoices.append(invoice)
-        
-        # Debug info
+            dated.append((formatted_date, position))
         if date_parse_errors:
-            print(f"Date parse errors: {date_parse_errors[:5]}")  # Show first 5 errors
+            print(f"Date parse errors: {date_parse_errors}")
+        
+        dated.sort()
+        keys = [formatted_date for formatted_date, _ in dated]
+        positions = [position for _, position in dated]
+        self._date_index = (values, keys, positions)
+        return keys, positions
+    
+    def _code_row(self, title, code):
+        """Số dòng của mã ở cột A (Mã KH/Mã SP), hoặc None.
+        Chỉ đọc cột A (col_values) thay vì cả sheet cho các lượt sửa/xóa một dòng"""
+        codes = self._worksheet(title).col_values(1)
+        try:
+            return codes.index(code, 1) + 1  # bỏ header; index 0 -> dòng 1
+        except ValueError:
+            return None
+    
+    def _load_customers_index(self):
+        """Cột SĐT và Tổng Chi Tiêu của KHACH_HANG cho các hàm ghi theo SĐT:
+        ({SĐT đã chuẩn hóa: dòng}, các ô Tổng Chi Tiêu theo dòng (ô[dòng - 1]), index cột Tổng Chi Tiêu).
+        Bố cục thường gặp (SĐT ở C, Tổng Chi Tiêu ở F) chỉ tốn một values.batchGet 2 cột;
+        header không khớp thì đọc cả sheet và tìm cột theo tên như các hàm đọc khác.
+        Đọc thẳng từ sheet, không dùng bản sao, vì số dòng sẽ được ghi vào"""
+        response = self.sheet.values_batch_get(
+            ['KHACH_HANG!C:C', 'KHACH_HANG!F:F'], params={'majorDimension': 'COLUMNS'})
+        phones, spent = ((value_range.get('values') or [[]])[0] for value_range in response['valueRanges'])
+        spent_col = 5  # cột F
+        if phones[:1] != ['Số Điện Thoại'] or spent[:1] != ['Tổng Chi Tiêu']:
+            all_values = self._worksheet('KHACH_HANG').get_all_values()
+            headers = all_values[0] if all_values else []
+            phone_col = headers.index('Số Điện Thoại')
+            spent_col = headers.index('Tổng Chi Tiêu')
+            phones = [row[phone_col] if phone_col < len(row) else '' for row in all_values]
+            spent = [row[spent_col] if spent_col < len(row) else '' for row in all_values]
+        phone_rows = {}
+        for row_number, cell in enumerate(phones[1:], start=2):  # dòng 1 là header
+            phone_rows.setdefault(_normalize_phone(cell), row_number)
+        return phone_rows, spent, spent_col
+    
+    def _customer_phones(self):
+        """{SĐT đã chuẩn hóa: tên khách} cho add_customer, giữ PHONE_INDEX_TTL giây.
+        Sửa/xóa khách hàng (generation KHACH_HANG đổi) thì đọc lại"""
+        generation = self._generations.get('KHACH_HANG', 0)
+        cached = self._phones
+        if cached and cached[1] == generation and time.monotonic() - cached[0] < self.PHONE_INDEX_TTL:
+            return cached[2]
         
-        return filtered_invoices
+        loaded_at = time.monotonic()
+        all_values = self._sheet_values('KHACH_HANG')
+        headers = all_values[0] if all_values else []
+        phone_col = headers.index('Số Điện Thoại') if 'Số Điện Thoại' in headers else 2  # cột C
+        name_col = headers.index('Tên Khách Hàng') if 'Tên Khách Hàng' in headers else 1  # cột B
+        phones = {}
+        for row in all_values[1:]:
+            if phone_col < len(row):
+                phone = _normalize_phone(row[phone_col])
+                if phone and phone not in phones:
+                    phones[phone] = row[name_col] if name_col < len(row) else ''
+        self._phones = (loaded_at, generation, phones)
+        return phones
+    
+    def _invalidate(self, *titles):
+        """Bỏ bản sao của các sheet vừa bị ghi"""
+        with self._snapshot_lock:
+            for title in titles:
+                self._snapshots.pop(title, None)
+                self._generations[title] = self._generations.get(title, 0) + 1
+    
+    def _parse_invoice_date(self, invoice_date_str):
+        """Convert DD/MM/YYYY HH:MM to YYYY-MM-DD for comparison"""
+        return _invoice_date_key(invoice_date_str)
+    
+    def _safe_parse_amount(self, amount_str):
+        """Safely parse amount string to float"""
+        # get_all_records đã numericise nên phần lớn ô tiền là int sẵn
+        if type(amount_str) is int:
+            return float(amount_str)
+        if not amount_str:
+            return 0.0
+        # _parse_amount_text tự trả 0.0 cho chuỗi không phải số, không cần try/except ở đây
+        return _parse_amount_text(str(amount_str))
     
     def connect(self):
         """Connect to Google Sheets"""
@@ -127,7 +380,21 @@ class GoogleSheetsAPI:
                 )
             
             # Authorize and create client
-            self.gc = gspread.authorize(creds)
+            # Session dùng chung một pool kết nối keep-alive (tránh bắt tay TLS
+            # mỗi lần gọi) và tự thử lại khi Google trả 429/5xx
+            session = AuthorizedSession(creds)
+            adapter = HTTPAdapter(
+                pool_connections=20,
+                pool_maxsize=50,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.2,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    raise_on_status=False
+                )
+            )
+            session.mount('https://', adapter)
+            self.gc = gspread.Client(auth=creds, session=session)
             
             # Open the spreadsheet
             self.sheet = self.gc.open_by_key('1ggIRSGuJ3kR1pgAkebLENRaVlJvUuIYz_wSZiqw9k8E')
@@ -144,11 +411,14 @@ class GoogleSheetsAPI:
     def ensure_sheets_exist(self):
         """Đảm bảo tất cả sheet cần thiết tồn tại"""
         try:
-            sheet_names = [sheet.title for sheet in self.sheet.worksheets()]
+            # Một lần gọi metadata lấy luôn handle của mọi sheet
+            self._worksheets = {sheet.title: sheet for sheet in self.sheet.worksheets()}
+            sheet_names = list(self._worksheets)
             
             # Create KHACH_HANG sheet if not exists
             if 'KHACH_HANG' not in sheet_names:
                 worksheet = self.sheet.add_worksheet(title='KHACH_HANG', rows=1000, cols=20)
+                self._worksheets['KHACH_HANG'] = worksheet
                 headers = [
                     'Mã KH', 'Tên Khách Hàng', 'Biệt Danh', 'Số Điện Thoại', '4 Số Cuối', 'Ngày Đăng Ký', 'Tổng Chi Tiêu',
                     'Lượt Chơi', 'Nước', 'Vé Freeroll', 'Hyper', 'Turbo', 'Happy', 'Deep Stack', 'Highroller', 
@@ -160,57 +430,58 @@ class GoogleSheetsAPI:
             # Create SAN_PHAM sheet if not exists
             if 'SAN_PHAM' not in sheet_names:
                 worksheet = self.sheet.add_worksheet(title='SAN_PHAM', rows=1000, cols=10)
+                self._worksheets['SAN_PHAM'] = worksheet
                 worksheet.append_row(['Mã SP', 'Tên Sản Phẩm', 'Danh Mục', 'Giá'])
                 print("✅ Created SAN_PHAM sheet")
             
             # Create HOA_DON sheet if not exists
             if 'HOA_DON' not in sheet_names:
                 worksheet = self.sheet.add_worksheet(title='HOA_DON', rows=1000, cols=15)
+                self._worksheets['HOA_DON'] = worksheet
                 worksheet.append_row(['Số HĐ', 'Ngày Giờ', 'Mã KH', 'Tên Khách', 'SĐT', 'Chi Tiết SP (JSON)', 'Tổng Tiền Hàng', 'Chiết Khấu %', 'Số Tiền Giảm', 'Tổng Thanh Toán', 'Hình Thức TT'])
                 print("✅ Created HOA_DON sheet")
             
             # Create THONG_KE sheet if not exists
             if 'THONG_KE' not in sheet_names:
                 worksheet = self.sheet.add_worksheet(title='THONG_KE', rows=1000, cols=10)
+                self._worksheets['THONG_KE'] = worksheet
                 worksheet.append_row(['Ngày', 'Doanh Thu Tiền Mặt', 'Doanh Thu Chuyển Khoản', 'Tổng Doanh Thu', 'Số Hóa Đơn'])
                 print("✅ Created THONG_KE sheet")
                 
         except Exception as e:
             print(f"⚠️ Warning: Could not ensure sheets exist: {e}")
     
-    def get_customers(self):
-        """Lấy danh sách khách hàng"""
+    def get_customers(self, columns=None):
+        """Lấy danh sách khách hàng (columns: chỉ lấy các cột này, None = tất cả)"""
         try:
-            worksheet = self.sheet.worksheet('KHACH_HANG')
-            # Lấy raw data để tránh format currency
-            all_values = worksheet.get_all_values()
-            
-            if len(all_values) <= 1:  # Chỉ có header hoặc không có data
-                return {'success': True, 'data': []}
-            
-            headers = all_values[0]
-            customers = []
-            
-            for row in all_values[1:]:
-                if not row[0]:  # Skip empty rows
-                    continue
-                    
-                customer = {}
-                for i, header in enumerate(headers):
-                    value = row[i] if i < len(row) else ''
-                    # Giữ nguyên raw value, không parse thành số
-                    customer[header] = value
-                
-                customers.append(customer)
-            
-            return {'success': True, 'data': customers}
+            return {'success': True, 'data': list(self.iter_customers(columns))}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
+    def iter_customers(self, columns=None):
+        """Duyệt từng khách hàng (cùng dạng với get_customers) mà không dựng cả list.
+        Lỗi kết nối được raise ở lần lấy phần tử đầu tiên."""
+        # Lấy raw data để tránh format currency
+        all_values = self._sheet_values('KHACH_HANG')
+        
+        if len(all_values) <= 1:  # Chỉ có header hoặc không có data
+            return
+        
+        headers = all_values[0]
+        picked = [(i, header) for i, header in enumerate(headers)
+                  if columns is None or header in columns]
+        
+        for row in all_values[1:]:
+            if not row[0]:  # Skip empty rows
+                continue
+            
+            # Giữ nguyên raw value, không parse thành số
+            yield {header: row[i] if i < len(row) else '' for i, header in picked}
+    
     def create_customer(self, customer_data):
         """Tạo khách hàng mới"""
         try:
-            worksheet = self.sheet.worksheet('KHACH_HANG')
+            worksheet = self._worksheet('KHACH_HANG')
             
             # Generate customer code
             name = customer_data.get('Tên Khách Hàng', '').strip()
@@ -231,7 +502,7 @@ class GoogleSheetsAPI:
                     if '-' in registration_date:
                         date_obj = datetime.strptime(registration_date, '%Y-%m-%d')
                         registration_date = date_obj.strftime('%d/%m/%Y')
-                except:
+                except ValueError:
                     pass  # Keep original format if conversion fails
             
             row_data = [
@@ -256,6 +527,7 @@ class GoogleSheetsAPI:
             ]
             
             worksheet.append_row(row_data)
+            self._invalidate('KHACH_HANG')
             return {'success': True, 'message': 'Tạo khách hàng thành công', 'customer_code': customer_code}
             
         except Exception as e:
@@ -264,24 +536,12 @@ class GoogleSheetsAPI:
     def update_customer(self, customer_code, customer_data):
         """Cập nhật khách hàng"""
         try:
-            print(f"🔍 update_customer called with code: {customer_code}, data: {customer_data}")
-            worksheet = self.sheet.worksheet('KHACH_HANG')
-            all_values = worksheet.get_all_values()
-            
-            if len(all_values) < 2:
-                return {'success': False, 'message': 'Không có dữ liệu khách hàng'}
+            logger.debug("🔍 update_customer called with code: %s, data: %s", customer_code, customer_data)
+            worksheet = self._worksheet('KHACH_HANG')
+            # Find customer row (cột A = Mã KH)
+            row_index = self._code_row('KHACH_HANG', customer_code)
             
-            headers = all_values[0]
-            print(f"📊 Headers: {headers}")
-            
-            # Find customer row
-            row_index = None
-            for i, row in enumerate(all_values[1:], start=2):  # Start from row 2 (skip header)
-                if len(row) > 0 and row[0] == customer_code:  # Check Mã KH column
-                    row_index = i
-                    break
-            
-            print(f"📍 Found customer at row: {row_index}")
+            logger.debug("📍 Found customer at row: %s", row_index)
             if not row_index:
                 return {'success': False, 'message': 'Không tìm thấy khách hàng'}
             
@@ -310,35 +570,29 @@ class GoogleSheetsAPI:
             ]
             
             # Update the row with new data (18 columns: A to R)
-            print(f"📝 Updating row {row_index} with data: {row_data}")
+            logger.debug("📝 Updating row %s with data: %s", row_index, row_data)
             worksheet.update(f'A{row_index}:R{row_index}', [row_data])
+            self._invalidate('KHACH_HANG')
             return {'success': True, 'message': 'Cập nhật khách hàng thành công'}
             
         except Exception as e:
-            print(f"❌ update_customer error: {str(e)}")
-            print(f"❌ Error type: {type(e)}")
-            import traceback
-            print(f"❌ Traceback: {traceback.format_exc()}")
+            logger.exception("❌ update_customer error: %s", e)
             return {'success': False, 'message': str(e)}
     
     def delete_customer(self, customer_code):
         """Xóa khách hàng"""
         try:
-            worksheet = self.sheet.worksheet('KHACH_HANG')
-            records = worksheet.get_all_records()
+            worksheet = self._worksheet('KHACH_HANG')
             
-            # Find customer row
-            row_index = None
-            for i, record in enumerate(records):
-                if record.get('Mã KH') == customer_code:
-                    row_index = i + 2  # +2 because sheets are 1-indexed and we have headers
-                    break
+            # Find customer row (cột A = Mã KH)
+            row_index = self._code_row('KHACH_HANG', customer_code)
             
             if not row_index:
                 return {'success': False, 'message': 'Không tìm thấy khách hàng'}
             
             # Delete row
             worksheet.delete_rows(row_index)
+            self._invalidate('KHACH_HANG')
             return {'success': True, 'message': 'Xóa khách hàng thành công'}
             
         except Exception as e:
@@ -347,7 +601,7 @@ class GoogleSheetsAPI:
     def update_sheet_structure(self):
         """Cập nhật cấu trúc sheet KHACH_HANG với các cột mới"""
         try:
-            worksheet = self.sheet.worksheet('KHACH_HANG')
+            worksheet = self.sheet.worksheet('KHACH_HANG')  # handle mới: cần row_count hiện tại
             
             # Get current headers
             headers = worksheet.row_values(1)
@@ -386,41 +640,46 @@ class GoogleSheetsAPI:
             current_col_count = len(headers)
             
             if missing_columns:
-                # Prepare batch update requests for headers
-                header_requests = []
-                for i, col in enumerate(missing_columns):
-                    col_letter = chr(ord('A') + current_col_count + i)
-                    header_requests.append({
-                        'range': f'KHACH_HANG!{col_letter}1',
-                        'values': [[col['name']]]
-                    })
+                # Header + giá trị mặc định của mọi cột mới trong một spreadsheets.batchUpdate:
+                # repeatCell điền cả cột bằng một giá trị thay vì gửi từng ô
+                sheet_id = worksheet.id
+                num_rows = worksheet.row_count
+                requests = []
                 
-                # Execute header updates
-                worksheet.batch_update(header_requests)
-                print(f"✅ Đã thêm {len(missing_columns)} headers mới")
+                # Sheet chưa đủ cột thì thêm cột trước khi ghi
+                needed_cols = current_col_count + len(missing_columns) - worksheet.col_count
+                if needed_cols > 0:
+                    requests.append({'appendDimension': {
+                        'sheetId': sheet_id, 'dimension': 'COLUMNS', 'length': needed_cols
+                    }})
                 
-                # Fill default values for existing customers
-                num_rows = worksheet.row_count
-                if num_rows > 1:  # Has data rows
-                    fill_requests = []
-                    for i, col in enumerate(missing_columns):
-                        col_letter = chr(ord('A') + current_col_count + i)
-                        range_to_fill = f'KHACH_HANG!{col_letter}2:{col_letter}{num_rows}'
-                        
-                        # Use appropriate default value based on type
-                        if col['type'] == 'text':
-                            default_value = col['default']  # Empty string
-                        else:
-                            default_value = col['default']  # 0 for numbers/currency
-                        
-                        fill_requests.append({
-                            'range': range_to_fill,
-                            'values': [[default_value]] * (num_rows - 1)
-                        })
+                for i, col in enumerate(missing_columns):
+                    col_index = current_col_count + i  # 0-based
+                    requests.append({'updateCells': {
+                        'range': {'sheetId': sheet_id, 'startRowIndex': 0, 'endRowIndex': 1,
+                                  'startColumnIndex': col_index, 'endColumnIndex': col_index + 1},
+                        'rows': [{'values': [{'userEnteredValue': {'stringValue': col['name']}}]}],
+                        'fields': 'userEnteredValue'
+                    }})
                     
-                    if fill_requests:
-                        worksheet.batch_update(fill_requests)
-                        print(f"✅ Đã điền giá trị mặc định cho {len(missing_columns)} cột")
+                    # Fill default values for existing customers
+                    if num_rows > 1:  # Has data rows
+                        # Use appropriate default value based on type ('' cho text, 0 cho number/currency)
+                        default_value = col['default']
+                        value_key = 'stringValue' if col['type'] == 'text' else 'numberValue'
+                        requests.append({'repeatCell': {
+                            'range': {'sheetId': sheet_id, 'startRowIndex': 1, 'endRowIndex': num_rows,
+                                      'startColumnIndex': col_index, 'endColumnIndex': col_index + 1},
+                            'cell': {'userEnteredValue': {value_key: default_value}},
+                            'fields': 'userEnteredValue'
+                        }})
+                
+                self.sheet.batch_update({'requests': requests})
+                print(f"✅ Đã thêm {len(missing_columns)} headers mới (từ cột {rowcol_to_a1(1, current_col_count + 1)})")
+                if num_rows > 1:
+                    print(f"✅ Đã điền giá trị mặc định cho {len(missing_columns)} cột")
+                
+                self._invalidate('KHACH_HANG')
             
             return {
                 'success': True, 
@@ -432,38 +691,45 @@ class GoogleSheetsAPI:
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
-    def get_products(self):
+    def get_products(self, columns=None):
         """Lấy danh sách sản phẩm"""
         try:
-            worksheet = self.sheet.worksheet('SAN_PHAM')
-            records = worksheet.get_all_records()
+            records = self._sheet_records('SAN_PHAM', columns)
             return {'success': True, 'data': records}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
-    def get_invoices(self):
-        """Lấy danh sách hóa đơn"""
+    def get_invoices(self, columns=None, date_from=None, date_to=None):
+        """Lấy danh sách hóa đơn; có date_from và date_to (YYYY-MM-DD) thì chỉ lấy
+        hóa đơn có ngày trong khoảng đó (tính cả hai đầu, giữ thứ tự trên sheet;
+        hóa đơn không đọc được ngày bị bỏ)"""
         try:
-            worksheet = self.sheet.worksheet('HOA_DON')
-            records = worksheet.get_all_records()
-            return {'success': True, 'data': records}
+            return {'success': True, 'data': list(self.iter_invoices(columns, date_from, date_to))}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
+    def iter_invoices(self, columns=None, date_from=None, date_to=None):
+        """Duyệt từng hóa đơn (cùng dạng với get_invoices) mà không dựng cả list.
+        Lỗi kết nối được raise ở lần lấy phần tử đầu tiên."""
+        values = self._sheet_values('HOA_DON')
+        positions = None
+        if date_from and date_to:
+            keys, by_date = self._invoice_date_index(values)
+            positions = sorted(by_date[bisect_left(keys, date_from):bisect_right(keys, date_to)])
+        yield from self._records(values, columns, positions)
+    
     def add_customer(self, customer):
         """Thêm khách hàng mới"""
         try:
-            worksheet = self.sheet.worksheet('KHACH_HANG')
+            worksheet = self._worksheet('KHACH_HANG')
             
             # Check if phone number already exists (handle empty sheet)
+            customer_phone = _normalize_phone(customer['phone'])
             try:
-                records = worksheet.get_all_records()
-                customer_phone = customer['phone'].replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-                
-                for record in records:
-                    existing_phone = str(record.get('Số Điện Thoại', '')).replace("'", '').replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-                    if existing_phone == customer_phone:
-                        return {'success': False, 'message': f'Số điện thoại {customer["phone"]} đã tồn tại cho khách hàng: {record.get("Tên Khách Hàng", "Unknown")}'}
+                phones = self._customer_phones()
+                if customer_phone in phones:
+                    existing_name = phones[customer_phone] or 'Unknown'
+                    return {'success': False, 'message': f'Số điện thoại {customer["phone"]} đã tồn tại cho khách hàng: {existing_name}'}
             except Exception as e:
                 print(f"⚠️ Warning: Could not check existing customers: {e}")
                 # Continue with adding new customer
@@ -473,10 +739,20 @@ class GoogleSheetsAPI:
                 customer['name'],
                 f"'{customer['phone']}",  # Add single quote to force text format
                 customer['last4'],
-                datetime.now(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%d/%m/%Y'),
+                datetime.now(VN_TZ).strftime('%d/%m/%Y'),
                 0
             ]
+            generation = self._generations.get('KHACH_HANG', 0)
             worksheet.append_row(row)
+            self._invalidate('KHACH_HANG')
+            
+            # Thêm dòng mới không làm sai SĐT cũ: cập nhật tại chỗ thay vì đọc lại cả sheet
+            # (chỉ khi không có lượt ghi nào khác chen vào giữa)
+            cached = self._phones
+            if cached and customer_phone and cached[1] == generation \
+                    and self._generations.get('KHACH_HANG', 0) == generation + 1:
+                cached[2].setdefault(customer_phone, customer['name'])
+                self._phones = (cached[0], generation + 1, cached[2])
             return {'success': True, 'message': 'Đã thêm khách hàng'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -484,7 +760,7 @@ class GoogleSheetsAPI:
     def add_product(self, product):
         """Thêm sản phẩm mới"""
         try:
-            worksheet = self.sheet.worksheet('SAN_PHAM')
+            worksheet = self._worksheet('SAN_PHAM')
             row = [
                 product['code'],
                 product['name'],
@@ -492,6 +768,7 @@ class GoogleSheetsAPI:
                 product['price']
             ]
             worksheet.append_row(row)
+            self._invalidate('SAN_PHAM')
             return {'success': True, 'message': 'Đã thêm sản phẩm'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -500,154 +777,196 @@ class GoogleSheetsAPI:
     def update_product(self, code, product):
         """Cập nhật thông tin sản phẩm"""
         try:
-            worksheet = self.sheet.worksheet('SAN_PHAM')
-            records = worksheet.get_all_records()
-            
-            for i, record in enumerate(records, start=2):  # Start from row 2 (skip header)
-                if record.get('Mã SP') == code:
-                    worksheet.update_cell(i, 2, product['name'])  # Tên
-                    worksheet.update_cell(i, 3, product['category'])  # Danh mục
-                    worksheet.update_cell(i, 4, product['price'])  # Giá
-                    return {'success': True, 'message': 'Đã cập nhật sản phẩm'}
-            
-            return {'success': False, 'message': 'Không tìm thấy sản phẩm'}
+            worksheet = self._worksheet('SAN_PHAM')
+            i = self._code_row('SAN_PHAM', code)
+            if not i:
+                return {'success': False, 'message': 'Không tìm thấy sản phẩm'}
+            
+            # Tên, Danh mục, Giá (cột B:D) trong một lần ghi; raw=False
+            # để Sheets tự parse giá như update_cell
+            worksheet.update(f'B{i}:D{i}', [[product['name'], product['category'], product['price']]], raw=False)
+            self._invalidate('SAN_PHAM')
+            return {'success': True, 'message': 'Đã cập nhật sản phẩm'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
     def delete_customer(self, code):
         """Xóa khách hàng"""
         try:
-            worksheet = self.sheet.worksheet('KHACH_HANG')
-            records = worksheet.get_all_records()
-            
-            for i, record in enumerate(records, start=2):  # Start from row 2 (skip header)
-                if record.get('Mã KH') == code:
-                    worksheet.delete_rows(i)
-                    return {'success': True, 'message': 'Đã xóa khách hàng'}
+            worksheet = self._worksheet('KHACH_HANG')
+            i = self._code_row('KHACH_HANG', code)
+            if not i:
+                return {'success': False, 'message': 'Không tìm thấy khách hàng'}
             
-            return {'success': False, 'message': 'Không tìm thấy khách hàng'}
+            worksheet.delete_rows(i)
+            self._invalidate('KHACH_HANG')
+            return {'success': True, 'message': 'Đã xóa khách hàng'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
     def delete_product(self, code):
         """Xóa sản phẩm"""
         try:
-            worksheet = self.sheet.worksheet('SAN_PHAM')
-            records = worksheet.get_all_records()
-            
-            for i, record in enumerate(records, start=2):  # Start from row 2 (skip header)
-                if record.get('Mã SP') == code:
-                    worksheet.delete_rows(i)
-                    return {'success': True, 'message': 'Đã xóa sản phẩm'}
-            
-            return {'success': False, 'message': 'Không tìm thấy sản phẩm'}
+            worksheet = self._worksheet('SAN_PHAM')
+            i = self._code_row('SAN_PHAM', code)
+            if not i:
+                return {'success': False, 'message': 'Không tìm thấy sản phẩm'}
+            
+            worksheet.delete_rows(i)
+            self._invalidate('SAN_PHAM')
+            return {'success': True, 'message': 'Đã xóa sản phẩm'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
     def save_invoice(self, invoice):
         """Lưu hóa đơn"""
         try:
-            print(f"🔍 Invoice data received: {invoice}")
-            print(f"🔍 Total type: {type(invoice.get('total'))}, value: {invoice.get('total')}")
-            print(f"🔍 Subtotal type: {type(invoice.get('subtotal'))}, value: {invoice.get('subtotal')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 Invoice data received: %s", invoice)
+                logger.debug("🔍 Total type: %s, value: %s", type(invoice.get('total')), invoice.get('total'))
+                logger.debug("🔍 Subtotal type: %s, value: %s", type(invoice.get('subtotal')), invoice.get('subtotal'))
             
-            worksheet = self.sheet.worksheet('HOA_DON')
+            now = datetime.now(VN_TZ)  # dùng chung cho dòng HOA_DON và THONG_KE
             row = [
                 invoice['invoiceId'],                                    # Số HĐ
-                datetime.now(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%d/%m/%Y %H:%M'),              # Ngày Giờ
+                now.strftime('%d/%m/%Y %H:%M'),                          # Ngày Giờ
                 invoice['customerCode'],                                 # Mã KH
                 invoice['customerName'],                                 # Tên Khách
                 f"'{invoice['customerPhone']}",                         # SĐT (force text format)
-                json.dumps(invoice['products'], ensure_ascii=False),    # Chi Tiết SP (JSON)
+                orjson.dumps(invoice['products']).decode(),             # Chi Tiết SP (JSON)
                 invoice['subtotal'],                                     # Tổng Tiền Hàng
                 invoice.get('discountPercent', 0),                       # Chiết Khấu %
                 invoice.get('discount', 0),                              # Số Tiền Giảm
                 invoice['total'],                                        # Tổng Thanh Toán
                 invoice['paymentMethod']                                 # Hình Thức TT
             ]
-            worksheet.append_row(row)
+            
+            # Ghi hóa đơn + thống kê + tổng chi tiêu khách trong một spreadsheets.batchUpdate
+            # (trước đây: append HOA_DON, update_cell KHACH_HANG, append THONG_KE - mỗi cái một lượt gọi)
+            requests = [
+                self._append_cells_request('HOA_DON', row),
+                self._append_cells_request('THONG_KE', self._stats_row(invoice, now)),
+            ]
             
             # Update customer total spent
-            self.update_customer_spent(invoice['customerPhone'], invoice['total'])
+            spent_request = self._customer_spent_request(invoice['customerPhone'], invoice['total'])
+            if spent_request:
+                requests.append(spent_request)
             
-            # Update stats
-            self.update_stats(invoice)
+            self.sheet.batch_update({'requests': requests})
+            self._invalidate('HOA_DON')
+            if spent_request:
+                self._invalidate('KHACH_HANG')
             
             return {'success': True, 'message': 'Đã lưu hóa đơn'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
-    def update_customer_spent(self, phone, amount):
-        """Cập nhật tổng chi tiêu của khách hàng"""
+    def _append_cells_request(self, title, row):
+        """Request appendCells thêm một dòng vào cuối sheet, giữ kiểu như append_row (RAW):
+        số ghi thành số, còn lại ghi nguyên chuỗi"""
+        cells = []
+        for value in row:
+            if value is None:
+                cells.append({})
+            elif isinstance(value, bool):
+                cells.append({'userEnteredValue': {'boolValue': value}})
+            elif isinstance(value, (int, float)):
+                cells.append({'userEnteredValue': {'numberValue': value}})
+            else:
+                cells.append({'userEnteredValue': {'stringValue': str(value)}})
+        return {'appendCells': {
+            'sheetId': self._worksheet(title).id,
+            'rows': [{'values': cells}],
+            'fields': 'userEnteredValue',
+        }}
+    
+    def _customer_spent_request(self, phone, amount):
+        """Request ghi Tổng Chi Tiêu mới cho khách có SĐT phone (None nếu không tìm thấy).
+        Đọc lại KHACH_HANG ngay lúc ghi, không dùng bản sao, để không cộng trên số cũ"""
         try:
-            print(f"🔍 Updating customer spent: phone={phone}, amount={amount}")
-            worksheet = self.sheet.worksheet('KHACH_HANG')
-            records = worksheet.get_all_records()
+            logger.debug("🔍 Updating customer spent: phone=%s, amount=%s", phone, amount)
+            phone_rows, spent, spent_col = self._load_customers_index()
             
-            print(f"🔍 Found {len(records)} customer records")
+            logger.debug("🔍 Found %d customer records", len(phone_rows))
             
-            for i, record in enumerate(records, start=2):
-                customer_phone = record.get('Số Điện Thoại')
-                print(f"🔍 Checking customer {i}: phone='{customer_phone}' (type: {type(customer_phone)}) vs search='{phone}' (type: {type(phone)})")
-                
-                # Compare phones directly (keep full phone numbers)
-                customer_phone_str = str(customer_phone).replace(' ', '').replace("'", '') if customer_phone else ''
-                search_phone_str = str(phone).replace(' ', '')
-                
-                if customer_phone_str == search_phone_str:
-                    print(f"✅ Found matching customer at row {i}")
-                    current_spent = record.get('Tổng Chi Tiêu', 0)
-                    print(f"🔍 Current spent: {current_spent} (type: {type(current_spent)})")
-                    
-                    if isinstance(current_spent, str):
-                        current_spent = current_spent.replace(' đ', '').replace(',', '')
-                        current_spent = int(current_spent) if current_spent.isdigit() else 0
-                    
-                    # Convert amount to int if it's a string
-                    if isinstance(amount, str):
-                        amount = int(amount) if amount.isdigit() else 0
-                    
-                    new_spent = current_spent + amount
-                    print(f"🔍 New spent: {new_spent}")
-                    worksheet.update_cell(i, 6, f"{new_spent:,} đ")
-                    print(f"✅ Updated customer spent to {new_spent:,} đ")
-                    break
-            else:
-                print(f"❌ No customer found with phone: {phone}")
+            # Compare phones directly (keep full phone numbers)
+            search_phone_str = _normalize_phone(phone)
+            i = phone_rows.get(search_phone_str) if search_phone_str else None
+            if not i:
+                logger.debug("❌ No customer found with phone: %s", phone)
+                return None
+            
+            logger.debug("✅ Found matching customer at row %s", i)
+            current_spent = numericise(spent[i - 1] if i <= len(spent) else '')
+            logger.debug("🔍 Current spent: %s (type: %s)", current_spent, type(current_spent))
+            
+            # Giữ dấu thập phân/dấu âm để float() đọc đúng; số âm hoặc không đọc được tính là 0
+            if isinstance(current_spent, str):
+                current_spent = current_spent.translate(_SPENT_STRIP)
+            current_spent = _request_amount(current_spent)
+            
+            amount = _request_amount(amount)
+            
+            new_spent = current_spent + amount
+            logger.debug("🔍 New spent: %s", new_spent)
+            # pasteData: Sheets parse giá trị như người dùng nhập, giống update_cell (USER_ENTERED)
+            return {'pasteData': {
+                'coordinate': {'sheetId': self._worksheet('KHACH_HANG').id, 'rowIndex': i - 1, 'columnIndex': spent_col},
+                'data': f"{new_spent:,} đ",
+                'type': 'PASTE_NORMAL',
+                'delimiter': '\t',
+            }}
+        except Exception as e:
+            logger.warning("❌ Lỗi cập nhật chi tiêu khách hàng: %s", e)
+            return None
+    
+    def update_customer_spent(self, phone, amount):
+        """Cập nhật tổng chi tiêu của khách hàng"""
+        try:
+            spent_request = self._customer_spent_request(phone, amount)
+            if spent_request:
+                self.sheet.batch_update({'requests': [spent_request]})
+                self._invalidate('KHACH_HANG')
+                logger.debug("✅ Updated customer spent to %s", spent_request['pasteData']['data'])
         except Exception as e:
-            print(f"❌ Lỗi cập nhật chi tiêu khách hàng: {e}")
+            logger.warning("❌ Lỗi cập nhật chi tiêu khách hàng: %s", e)
+    
+    def _stats_row(self, invoice, now=None):
+        """Dòng THONG_KE cho một hóa đơn (now: thời điểm lưu hóa đơn, mặc định là bây giờ)"""
+        today = (now or datetime.now(VN_TZ)).strftime('%d/%m/%Y')
+        
+        # Convert to proper format for Google Sheets
+        total = str(invoice['total'])
+        cash_amount = str(invoice['total']) if invoice['paymentMethod'] == 'cash' else '0'
+        transfer_amount = str(invoice['total']) if invoice['paymentMethod'] == 'transfer' else '0'
+        
+        return [
+            today,           # Ngày
+            invoice['invoiceId'],  # Số Hóa Đơn
+            total,           # Tổng Doanh Thu
+            cash_amount,     # Tiền Mặt
+            transfer_amount  # Chuyển Khoản
+        ]
     
     def update_stats(self, invoice):
         """Cập nhật thống kê"""
         try:
-            worksheet = self.sheet.worksheet('THONG_KE')
-            today = datetime.now(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%d/%m/%Y')
-            
-            # Convert to proper format for Google Sheets
-            total = str(invoice['total'])
-            cash_amount = str(invoice['total']) if invoice['paymentMethod'] == 'cash' else '0'
-            transfer_amount = str(invoice['total']) if invoice['paymentMethod'] == 'transfer' else '0'
-            
-            row = [
-                today,           # Ngày
-                invoice['invoiceId'],  # Số Hóa Đơn
-                total,           # Tổng Doanh Thu
-                cash_amount,     # Tiền Mặt
-                transfer_amount  # Chuyển Khoản
-            ]
-            worksheet.append_row(row)
+            self._worksheet('THONG_KE').append_row(self._stats_row(invoice))
         except Exception as e:
             print(f"Lỗi cập nhật thống kê: {e}")
 
     def get_dashboard_stats(self, date_from=None, date_to=None, debug_mode=False):
         """Lấy thống kê tổng quan dashboard"""
         try:
-            debug_info = {}
-            
             # Lấy dữ liệu từ các sheet
-            invoices = self.get_invoices()
-            customers = self.get_customers()
-            products = self.get_products()
+            self.prefetch_sheets('HOA_DON', 'KHACH_HANG', 'SAN_PHAM')
+            # Chỉ dựng dict 4 cột cần dùng; debug_mode cần hóa đơn đầy đủ cho sample_invoices
+            invoices = self.get_invoices(columns=None if debug_mode else _DASHBOARD_INVOICE_COLUMNS,
+                                         date_from=date_from, date_to=date_to)
+            # Khách hàng/sản phẩm chỉ dùng để đếm
+            customers = self.get_customers(columns=('Mã KH',))
+            products = self.get_products(columns=('Mã SP',))
             
             if not invoices['success'] or not customers['success'] or not products['success']:
                 return {'success': False, 'message': 'Không thể lấy dữ liệu từ Google Sheets'}
@@ -656,42 +975,32 @@ class GoogleSheetsAPI:
             customer_data = customers['data']
             product_data = products['data']
             
-            debug_info['total_invoices_before_filter'] = len(invoice_data)
-            debug_info['total_customers_before_filter'] = len(customer_data)
-            debug_info['total_products'] = len(product_data)
-            
-            # Lọc theo ngày nếu có
-            invoice_data = self._filter_invoices_by_date(invoice_data, date_from, date_to)
-            
-            debug_info['total_invoices_after_filter'] = len(invoice_data)
-            debug_info['date_from'] = date_from
-            debug_info['date_to'] = date_to
-            
-            # Tính toán thống kê - sử dụng hàm parse an toàn
-            total_revenue = sum(self._safe_parse_amount(inv.get('Tổng Thanh Toán', 0)) for inv in invoice_data)
-            total_invoices = len(invoice_data)
-            
+            # Tính toán thống kê trong một vòng duy nhất - mỗi hóa đơn chỉ parse số tiền 1 lần
+            parse_amount = self._safe_parse_amount
+            total_revenue = cash_revenue = transfer_revenue = 0
             # Đếm khách hàng thực tế có hóa đơn trong khoảng thời gian (theo tên, không theo mã)
             customer_names_in_period = set()
+            add_name = customer_names_in_period.add
             for inv in invoice_data:
+                amount = parse_amount(inv.get('Tổng Thanh Toán', 0))
+                total_revenue += amount
+                method = inv.get('Hình Thức TT')
+                if method == 'cash':
+                    cash_revenue += amount
+                elif method == 'transfer':
+                    transfer_revenue += amount
                 customer_name = inv.get('Tên Khách', '').strip()
                 if customer_name:
-                    customer_names_in_period.add(customer_name)
+                    add_name(customer_name)
+            total_invoices = len(invoice_data)
             total_customers = len(customer_names_in_period)
             
             total_products = len(product_data)
             
-            # Thống kê theo hình thức thanh toán
-            cash_revenue = sum(self._safe_parse_amount(inv.get('Tổng Thanh Toán', 0)) for inv in invoice_data if inv.get('Hình Thức TT') == 'cash')
-            transfer_revenue = sum(self._safe_parse_amount(inv.get('Tổng Thanh Toán', 0)) for inv in invoice_data if inv.get('Hình Thức TT') == 'transfer')
-            
             # Tính tổng chi tiêu khách hàng từ hóa đơn thực tế (không dùng field Tổng Chi Tiêu)
             total_customer_spent = total_revenue  # Tổng chi tiêu = tổng doanh thu
             avg_customer_spent = total_customer_spent / total_customers if total_customers > 0 else 0
             
-            debug_info['customer_names_in_period'] = list(customer_names_in_period)
-            debug_info['sample_invoices'] = invoice_data[:5] if len(invoice_data) > 5 else invoice_data
-            
             result = {
                 'success': True,
                 'data': {
@@ -707,8 +1016,18 @@ class GoogleSheetsAPI:
                 }
             }
             
+            # debug_info chỉ dựng khi được yêu cầu (list tên khách, 5 hóa đơn mẫu)
             if debug_mode:
-                result['debug_info'] = debug_info
+                result['debug_info'] = {
+                    'total_invoices_before_filter': max(len(self._sheet_values('HOA_DON')) - 1, 0),
+                    'total_customers_before_filter': len(customer_data),
+                    'total_products': len(product_data),
+                    'total_invoices_after_filter': len(invoice_data),
+                    'date_from': date_from,
+                    'date_to': date_to,
+                    'customer_names_in_period': list(customer_names_in_period),
+                    'sample_invoices': invoice_data[:5],
+                }
             
             return result
         except Exception as e:
@@ -717,44 +1036,41 @@ class GoogleSheetsAPI:
     def get_product_stats(self, date_from=None, date_to=None):
         """Lấy thống kê sản phẩm bán chạy"""
         try:
-            invoices = self.get_invoices()
-            if not invoices['success']:
-                return {'success': False, 'message': 'Không thể lấy dữ liệu hóa đơn'}
-            
-            invoice_data = invoices['data']
-            
-            # Lọc theo ngày nếu có
-            invoice_data = self._filter_invoices_by_date(invoice_data, date_from, date_to)
+            # Lọc theo ngày nếu có; duyệt thẳng từng hóa đơn, không dựng list trung gian
+            invoice_data = self.iter_invoices(_PRODUCT_STATS_INVOICE_COLUMNS, date_from, date_to)
             
-            # Thống kê sản phẩm
-            product_stats = {}
+            # Thống kê sản phẩm - gom theo tên trong một dict (hash group-by)
+            product_stats = defaultdict(lambda: {'quantity': 0, 'revenue': 0})
+            parse_amount = self._safe_parse_amount
+            loads = orjson.loads
             for invoice in invoice_data:
                 products_json = invoice.get('Chi Tiết SP (JSON)', '[]')
+                # Ô trống/không phải mảng JSON thì bỏ qua luôn, không tốn loads + except
+                if type(products_json) is not str or not products_json.startswith('['):
+                    continue
                 try:
-                    products = json.loads(products_json)
+                    products = loads(products_json)
                     for product in products:
                         name = product.get('name', '')
                         quantity = int(product.get('quantity', 0))
-                        total = self._safe_parse_amount(product.get('total', 0))
+                        total = parse_amount(product.get('total', 0))
                         
-                        if name in product_stats:
-                            product_stats[name]['quantity'] += quantity
-                            product_stats[name]['revenue'] += total
-                        else:
-                            product_stats[name] = {
-                                'name': name,
-                                'quantity': quantity,
-                                'revenue': total
-                            }
-                except:
+                        stats = product_stats[name]
+                        stats['quantity'] += quantity
+                        stats['revenue'] += total
+                except (ValueError, TypeError, AttributeError):  # JSON hỏng, số lượng/tên sai kiểu
                     continue
             
-            # Sắp xếp theo doanh thu
-            sorted_products = sorted(product_stats.values(), key=lambda x: x['revenue'], reverse=True)
+            # Top 10 theo doanh thu: heap giữ 10 phần tử thay vì sắp xếp cả danh sách
+            # (thứ tự khi bằng doanh thu giữ như sorted(...)[:10])
+            top_products = [
+                {'name': name, **stats}
+                for name, stats in heapq.nlargest(10, product_stats.items(), key=lambda x: x[1]['revenue'])
+            ]
             
             return {
                 'success': True,
-                'data': sorted_products[:10]  # Top 10 sản phẩm
+                'data': top_products  # Top 10 sản phẩm
             }
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -762,17 +1078,27 @@ class GoogleSheetsAPI:
     def get_customer_stats(self, date_from=None, date_to=None):
         """Lấy thống kê khách hàng"""
         try:
-            customers = self.get_customers()
-            invoices = self.get_invoices()
-            
-            if not customers['success'] or not invoices['success']:
+            self.prefetch_sheets('KHACH_HANG', 'HOA_DON')
+            customers = self.get_customers(columns=('Mã KH', 'Tên Khách Hàng'))
+            if not customers['success']:
                 return {'success': False, 'message': 'Không thể lấy dữ liệu'}
             
             customer_data = customers['data']
-            invoice_data = invoices['data']
-            
-            # Lọc hóa đơn theo ngày nếu có - sử dụng hàm _filter_invoices_by_date
-            invoice_data = self._filter_invoices_by_date(invoice_data, date_from, date_to)
+            # Lọc hóa đơn theo ngày nếu có; duyệt thẳng từng hóa đơn, không dựng list trung gian
+            invoice_data = self.iter_invoices(_CUSTOMER_STATS_INVOICE_COLUMNS, date_from, date_to)
+            
+            # Tính tổng chi tiêu từ hóa đơn thực tế (không dùng field Tổng Chi Tiêu):
+            # một lượt qua hóa đơn gom theo Mã KH -> [tổng tiền, số hóa đơn],
+            # thay vì lọc lại toàn bộ hóa đơn cho từng khách (O(N·M))
+            spent_by_code = {}
+            parse_amount = self._safe_parse_amount
+            for inv in invoice_data:
+                code = inv.get('Mã KH')
+                totals = spent_by_code.get(code)
+                if totals is None:
+                    totals = spent_by_code[code] = [0, 0]
+                totals[0] += parse_amount(inv.get('Tổng Thanh Toán', 0))
+                totals[1] += 1
             
             # Thống kê khách hàng
             customer_stats = []
@@ -780,13 +1106,10 @@ class GoogleSheetsAPI:
                 customer_code = customer.get('Mã KH', '')
                 customer_name = customer.get('Tên Khách Hàng', '')
                 
-                # Tính tổng chi tiêu từ hóa đơn thực tế (không dùng field Tổng Chi Tiêu)
-                customer_invoices = [inv for inv in invoice_data if inv.get('Mã KH') == customer_code]
-                total_spent = sum(self._safe_parse_amount(inv.get('Tổng Thanh Toán', 0)) for inv in customer_invoices)
-                invoice_count = len(customer_invoices)
-                
                 # Chỉ thêm khách hàng có hóa đơn trong khoảng thời gian
-                if invoice_count > 0:
+                totals = spent_by_code.get(customer_code)
+                if totals is not None:
+                    total_spent, invoice_count = totals
                     customer_stats.append({
                         'code': customer_code,
                         'name': customer_name,
@@ -795,7 +1118,7 @@ class GoogleSheetsAPI:
                     })
             
             # Sắp xếp theo tổng chi tiêu
-            sorted_customers = sorted(customer_stats, key=lambda x: x['total_spent'], reverse=True)
+            sorted_customers = sorted(customer_stats, key=itemgetter('total_spent'), reverse=True)
             
             return {
                 'success': True,
@@ -807,48 +1130,39 @@ class GoogleSheetsAPI:
     def get_revenue_stats(self, period='day', date_from=None, date_to=None):
         """Lấy thống kê doanh thu theo thời gian"""
         try:
-            invoices = self.get_invoices()
-            if not invoices['success']:
-                return {'success': False, 'message': 'Không thể lấy dữ liệu hóa đơn'}
-            
-            invoice_data = invoices['data']
-            
-            # Lọc theo ngày nếu có
-            invoice_data = self._filter_invoices_by_date(invoice_data, date_from, date_to)
+            # Lọc theo ngày nếu có; duyệt thẳng từng hóa đơn, không dựng list trung gian
+            invoice_data = self.iter_invoices(('Ngày Giờ', 'Tổng Thanh Toán'), date_from, date_to)
+            
+            # Nhóm theo thời gian: dùng ngày YYYY-MM-DD đã parse (có cache) của
+            # _invoice_date_key, gom theo một lát cắt của chuỗi đó và chỉ dựng
+            # nhãn hiển thị một lần cho mỗi nhóm
+            if period == 'day':
+                bucket_of = None  # cả chuỗi YYYY-MM-DD
+                label_of = lambda d: f"{d[8:10]}/{d[5:7]}/{d[0:4]}"
+            elif period == 'week':
+                # Tuần trong tháng (nhãn "Tuần n/mm/yyyy" frontend đang hiển thị), tra bảng thay vì int()
+                bucket_of = lambda d: (d[0:7], _WEEK_OF_DAY.get(d[8:10]) or (int(d[8:10]) - 1) // 7 + 1)
+                label_of = lambda b: f"Tuần {b[1]}/{b[0][5:7]}/{b[0][0:4]}"
+            elif period == 'month':
+                bucket_of = lambda d: d[0:7]
+                label_of = lambda d: f"{d[5:7]}/{d[0:4]}"
+            else:
+                return {'success': True, 'data': []}
             
-            # Nhóm theo thời gian
-            revenue_by_period = {}
+            revenue_by_bucket = defaultdict(float)
+            date_key = _invoice_date_key
+            parse_amount = self._safe_parse_amount
             for invoice in invoice_data:
-                date_str = invoice.get('Ngày Giờ', '')
-                if not date_str:
-                    continue
-                
-                try:
-                    # Parse ngày từ format "dd/mm/yyyy hh:mm"
-                    date_part = date_str.split(' ')[0]  # Lấy phần ngày
-                    day, month, year = date_part.split('/')
-                    
-                    if period == 'day':
-                        key = f"{day}/{month}/{year}"
-                    elif period == 'week':
-                        # Tính tuần (đơn giản)
-                        week_num = (int(day) - 1) // 7 + 1
-                        key = f"Tuần {week_num}/{month}/{year}"
-                    elif period == 'month':
-                        key = f"{month}/{year}"
-                    
-                    revenue = self._safe_parse_amount(invoice.get('Tổng Thanh Toán', 0))
-                    
-                    if key in revenue_by_period:
-                        revenue_by_period[key] += revenue
-                    else:
-                        revenue_by_period[key] = revenue
-                except:
+                d = date_key(invoice.get('Ngày Giờ', ''))
+                if d is None:
                     continue
+                bucket = d if bucket_of is None else bucket_of(d)
+                revenue_by_bucket[bucket] += parse_amount(invoice.get('Tổng Thanh Toán', 0))
             
-            # Chuyển thành array và sắp xếp
-            revenue_data = [{'period': k, 'revenue': v} for k, v in revenue_by_period.items()]
-            revenue_data.sort(key=lambda x: x['period'])
+            # Sắp xếp theo nhóm (YYYY-MM-DD / (YYYY-MM, tuần) / YYYY-MM) cho đúng thứ tự thời gian,
+            # nhãn dd/mm/yyyy sắp theo chuỗi sẽ xếp theo ngày trước tháng
+            revenue_data = [{'period': label_of(bucket), 'revenue': revenue}
+                            for bucket, revenue in sorted(revenue_by_bucket.items())]
             
             return {
                 'success': True,
@@ -0,0 +1,54 @@
+"""Kiểm tra cập nhật Tổng Chi Tiêu khi lưu hóa đơn (không gọi Google Sheets thật)"""
+
+import pytest
+
+from google_sheets_api import GoogleSheetsAPI, _request_amount
+
+
+class FakeWorksheet:
+    id = 7
+
+
+class FakeSpreadsheet:
+    """values_batch_get trả về cột SĐT (C) và Tổng Chi Tiêu (F) của KHACH_HANG"""
+
+    def __init__(self, spent_cell):
+        self.spent_cell = spent_cell
+
+    def values_batch_get(self, ranges, params=None):
+        return {'valueRanges': [
+            {'values': [['Số Điện Thoại', '0901234567']]},
+            {'values': [['Tổng Chi Tiêu', self.spent_cell]]},
+        ]}
+
+
+def spent_after_invoice(spent_cell, amount):
+    api = GoogleSheetsAPI.__new__(GoogleSheetsAPI)  # bỏ qua connect()
+    api.sheet = FakeSpreadsheet(spent_cell)
+    api._worksheet = lambda title: FakeWorksheet()
+    request = api._customer_spent_request('0901234567', amount)
+    return request['pasteData']['data']
+
+
+@pytest.mark.parametrize('spent_cell, expected', [
+    ('1,250,000 đ', '1,350,000 đ'),
+    ('1,250,000.50 đ', '1,350,000 đ'),  # không thành 125000050
+    ('-5', '100,000 đ'),                # số âm tính là 0, không thành 5
+    ('abc', '100,000 đ'),
+    ('', '100,000 đ'),
+])
+def test_current_spent_cell(spent_cell, expected):
+    assert spent_after_invoice(spent_cell, '100000') == expected
+
+
+@pytest.mark.parametrize('amount, expected', [
+    ('11110.5', 11110),  # frontend gửi String(parseFloat(...))
+    ('150000', 150000),
+    (150000, 150000),
+    ('-5', 0),
+    ('abc', 0),
+    ('nan', 0),
+    (None, 0),
+])
+def test_request_amount(amount, expected):
+    assert _request_amount(amount) == expected